@@ -43,6 +43,7 @@ type UserAccount = {
   roomsCreated?: number;
   isBanned?: boolean;
   isGloballyMuted?: boolean;
+  authToken?: string;
 };
 
 type Room = {
@@ -702,7 +703,17 @@ const AuthPage = ({ onAuthSuccess }: AuthPageProps) => {
   const [showBannedModal, setShowBannedModal] = useState(false);
 
   const connectSocket = (authData: object, callback: (err: Error | null, socket?: Socket, user?: UserAccount) => void) => {
-    const socket = io(API_URL, { auth: authData, withCredentials: true });
+    // After the first handshake the server hands back a signed session token;
+    // reconnects present that instead of replaying credentials.
+    let sessionToken: string | null = null;
+    const socket = io(API_URL, {
+      auth: (cb) => cb(sessionToken ? { type: 'token', token: sessionToken } : authData),
+      withCredentials: true,
+    });
+
+    socket.on("self details", (user: UserAccount) => {
+      if (user.authToken) sessionToken = user.authToken;
+    });
 
     socket.on("connect", () => {
       socket.on("self details", (user: UserAccount) => {
@@ -711,6 +722,9 @@ const AuthPage = ({ onAuthSuccess }: AuthPageProps) => {
     });
 
     socket.on("connect_error", (err) => {
+      // A rejected token (e.g. server restarted with a new secret) shouldn't
+      // be retried; fall back to the original credentials.
+      if (err.message.includes("Invalid or expired session")) sessionToken = null;
       // MODIFIED: Pass specific error messages
       if (err.message.includes("banned")) {
         callback(new Error("banned"), undefined, undefined);
@@ -1567,6 +1581,12 @@ function ChatApp({ socket, initialUser, initialRoom, onExit, onViewProfile, onWh
       setUsers(list);
       setUsersWithDetails(Object.fromEntries(list.map(u => [u.name, u])));
     });
+    // Minimal diff for role changes; the roster itself is unchanged
+    socket.on("user role update", ({ userId, role }: { userId: string; role: User['role'] }) => {
+      const patchUser = (u: User) => (u.id === userId ? { ...u, role } : u);
+      setUsers((prev) => prev.map(patchUser));
+      setUsersWithDetails((prev) => Object.fromEntries(Object.entries(prev).map(([name, u]) => [name, patchUser(u)])));
+    });
     socket.on("chat message", (msg: Message) => {
       if (msg.room !== currentRoom.name) return;
       if (msg.user === 'System' || msg.type === 'server') playSound('notify');
@@ -1593,6 +1613,7 @@ function ChatApp({ socket, initialUser, initialRoom, onExit, onViewProfile, onWh
     return () => {
       socket.emit("leave room");
       socket.off("disconnect"); socket.off("connect"); socket.off("self details"); socket.off("user list");
+      socket.off("user role update");
       socket.off("chat message"); socket.off("message updated"); // socket.off("report");
       socket.off("message limit reached"); socket.off("force switch room"); socket.off("room update");
       socket.off("history cleared"); socket.off("server reboot");
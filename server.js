@@ -2,6 +2,7 @@ import express from "express";
 import http from "http";
 import { Server } from "socket.io";
 import cors from "cors";
+import crypto from "crypto";
 import path from "path";
 import { fileURLToPath } from "url";
 import * as RoomEngine from "./roomEngine.js";
@@ -23,6 +24,11 @@ const ALLOWED_ORIGINS = process.env.ALLOWED_ORIGINS
     "http://localhost:5174"
   ];
 
+// Secret for signing session tokens. A random per-boot fallback means tokens
+// don't survive a restart unless SESSION_SECRET is configured, which is fine:
+// clients just fall back to a full login.
+const SESSION_SECRET = process.env.SESSION_SECRET || crypto.randomBytes(32).toString("hex");
+
 const corsOptions = {
   origin: (origin, callback) => {
     // Allow requests with no origin (like mobile apps or curl)
@@ -38,17 +44,24 @@ const corsOptions = {
   credentials: true
 };
 
-const io = new Server(server, { cors: corsOptions });
+const io = new Server(server, {
+  cors: corsOptions,
+  // Per-message deflate costs far more CPU than it saves on chat-sized
+  // payloads, so keep it off and rely on small JSON frames instead.
+  perMessageDeflate: false,
+  // Cap inbound frames at 1 MB so a single client can't buffer up huge payloads.
+  maxHttpBufferSize: 1e6,
+  // Detect dead connections quickly so stale sockets don't linger in rooms.
+  pingInterval: 25000,
+  pingTimeout: 20000,
+});
 
 // Middleware
 app.use(cors(corsOptions));
 app.use(express.json());
 
-// Serve static files from React build (production)
-app.use(express.static(path.join(__dirname, "client/dist")));
-
-// API routes will be handled before the catch-all
-// The catch-all for React SPA routing is at the end of the file
+// API routes are registered first; the static middleware and SPA catch-all
+// for the React build are at the end of the file
 
 // --- Server State ---
 const userAccounts = {
@@ -84,21 +97,141 @@ const messagesByRoom = {
   music: [],
   help: [],
 };
+// Cap each room's retained history so long-lived rooms don't grow without
+// bound and "join room" doesn't serialize an ever-growing replay array.
+const MAX_ROOM_HISTORY = 200;
+// Reject oversized messages before they are stored, broadcast to the whole
+// room, and run through the moderation/AI regexes.
+const MAX_MESSAGE_LENGTH = 2000;
 const bannedUserIds = new Set();
 
 // NEW: State for Reports and Tickets
 const reports = [];
 const supportTickets = [];
+
+// Per-room membership index: roomName -> Set of socketIds whose mainRoom is that room.
+// Kept in sync wherever mainRoom changes so room-scoped lookups don't have to
+// scan every online user.
+const roomMembers = {};
+
+const addRoomMember = (roomName, socketId) => {
+  if (!roomMembers[roomName]) roomMembers[roomName] = new Set();
+  roomMembers[roomName].add(socketId);
+};
+const removeRoomMember = (roomName, socketId) => {
+  const members = roomMembers[roomName];
+  if (!members) return;
+  members.delete(socketId);
+  if (members.size === 0) delete roomMembers[roomName];
+};
+
+// Cached host-id Sets per room so role lookups are O(1) instead of scanning
+// the hosts array for every user on every list rebuild. Built lazily and
+// dropped whenever a room's hosts change (hosts change rarely, lists are
+// rebuilt on every socket event).
+const roomHostSets = {};
+
+const getHostSet = (roomName) => {
+  let hostSet = roomHostSets[roomName];
+  if (!hostSet) {
+    hostSet = roomHostSets[roomName] = new Set(rooms[roomName]?.hosts);
+  }
+  return hostSet;
+};
+const invalidateHostSet = (roomName) => { delete roomHostSets[roomName]; };
+
+// Presence index: userId -> socketId, maintained on connect/disconnect so
+// getSocketIdByUserId is a single map lookup instead of a scan over every
+// online user. If the same account connects twice the newest socket wins;
+// the entry is only removed when the socket it points at disconnects.
+const userIdToSocketId = new Map();
+
+// Every username-keyed index must write and look up with the same
+// normalization, otherwise a name registered with stray whitespace gets a
+// key no lookup can ever produce.
+const normalizeUsername = (username) => username.toLowerCase().trim();
+
+// Account lookup index: normalized username -> account id. Usernames are
+// immutable once registered, so this only needs updating on registration;
+// it replaces full scans of userAccounts on the auth and lookup paths.
+const usernameToAccountId = new Map(
+  Object.values(userAccounts).map(u => [normalizeUsername(u.username), u.id])
+);
+
+const getAccountByUsername = (username) => {
+  if (!username) return null;
+  const accountId = usernameToAccountId.get(normalizeUsername(username));
+  return accountId ? userAccounts[accountId] : null;
+};
+
+// Secondary account index for the registration uniqueness check. Updated on
+// registration and when an admin edits a user's email.
+const emailToAccountId = new Map(
+  Object.values(userAccounts).map(u => [u.email.toLowerCase(), u.id])
+);
+
+// Presence index by name: lowercased online username -> socketId. Covers the
+// guest-name-in-use check and username-based moderation lookups, which
+// otherwise scan every online user.
+const usernameToSocketId = new Map();
 // --- End Server State ---
 
 
 // --- Helper Functions ---
+// Signed session tokens: `<userId>.<hmac>`. A valid signature proves the id
+// was issued by us, so reconnects can be authenticated with one map lookup
+// instead of re-sending credentials and re-running the login checks.
+const signSessionToken = (userId) => {
+  const signature = crypto.createHmac("sha256", SESSION_SECRET).update(userId).digest("hex");
+  return `${userId}.${signature}`;
+};
+const verifySessionToken = (token) => {
+  if (typeof token !== "string") return null;
+  const dot = token.lastIndexOf(".");
+  if (dot === -1) return null;
+  const userId = token.slice(0, dot);
+  const signature = Buffer.from(token.slice(dot + 1), "hex");
+  const expected = crypto.createHmac("sha256", SESSION_SECRET).update(userId).digest();
+  if (signature.length !== expected.length || !crypto.timingSafeEqual(signature, expected)) {
+    return null;
+  }
+  return userId;
+};
+
+// Shared time formatter: toLocaleTimeString constructs a fresh
+// Intl.DateTimeFormat on every call, which dominates the cost of stamping a
+// message. Build the formatter once, and since message times only carry
+// minute resolution, reuse the formatted string until the minute rolls over.
+const timeFormatter = new Intl.DateTimeFormat([], { hour: '2-digit', minute: '2-digit' });
+let lastFormattedMinute = -1;
+let lastFormattedTime = "";
+const formatMessageTime = () => {
+  const minute = Math.floor(Date.now() / 60000);
+  if (minute !== lastFormattedMinute) {
+    lastFormattedMinute = minute;
+    lastFormattedTime = timeFormatter.format(new Date());
+  }
+  return lastFormattedTime;
+};
+
+// Reports and tickets carry ISO-8601 timestamps, which order correctly as
+// plain strings — no need to build two Date objects per comparison.
+const byTimestampDesc = (a, b) =>
+  a.timestamp < b.timestamp ? 1 : a.timestamp > b.timestamp ? -1 : 0;
+
+const pushRoomMessage = (roomName, message) => {
+  if (!messagesByRoom[roomName]) messagesByRoom[roomName] = [];
+  const history = messagesByRoom[roomName];
+  history.push(message);
+  if (history.length > MAX_ROOM_HISTORY) history.shift();
+};
+
 const sendSystemMessageToSocket = (socketId, roomName, text) => {
   io.to(socketId).emit("chat message", {
     id: `${Date.now()}-${Math.random().toString(36).substr(2, 9)}`,
     user: 'System',
     text: text,
-    time: new Date().toLocaleTimeString([], { hour: '2-digit', minute: '2-digit' }),
+    time: formatMessageTime(),
     type: 'system',
     room: roomName,
   });
@@ -108,11 +241,10 @@ const createSystemMessage = (room, text, type = 'system') => {
   const message = {
     id: `${Date.now()}-${Math.random().toString(36).substr(2, 9)}`,
     user: 'System', text,
-    time: new Date().toLocaleTimeString([], { hour: '2-digit', minute: '2-digit' }),
+    time: formatMessageTime(),
     type: type, room: room,
   };
-  if (!messagesByRoom[room]) messagesByRoom[room] = [];
-  messagesByRoom[room].push(message);
+  pushRoomMessage(room, message);
   io.to(room).emit("chat message", message);
 };
 const createBotMessage = (room, text, messageType = 'user') => {
@@ -121,12 +253,11 @@ const createBotMessage = (room, text, messageType = 'user') => {
     id: `${Date.now()}-${Math.random().toString(36).substr(2, 9)}`,
     user: 'AI_Bot',
     text,
-    time: new Date().toLocaleTimeString([], { hour: '2-digit', minute: '2-digit' }),
+    time: formatMessageTime(),
     type: messageType === 'thought' ? 'thought' : 'user', // Support thought type
     room: room,
   };
-  if (!messagesByRoom[room]) messagesByRoom[room] = [];
-  messagesByRoom[room].push(message);
+  pushRoomMessage(room, message);
   io.to(room).emit("chat message", message);
 };
 // --- Enhanced AI System ---
@@ -1057,16 +1188,12 @@ const getAdminRoomContext = (adminId) => {
 
 // Find user by username (case-insensitive) - used by admin commands
 const findUserByUsernameForAdmin = (username) => {
-  const normalizedUsername = username.toLowerCase().trim();
-  const onlineSocketId = Object.keys(onlineUsers).find(socketId => 
-    onlineUsers[socketId].username.toLowerCase() === normalizedUsername
-  );
-  if (onlineSocketId) {
+  const normalizedUsername = normalizeUsername(username);
+  const onlineSocketId = usernameToSocketId.get(normalizedUsername);
+  if (onlineSocketId && onlineUsers[onlineSocketId]) {
     return { ...onlineUsers[onlineSocketId], socketId: onlineSocketId };
   }
-  const account = Object.values(userAccounts).find(u => 
-    u.username.toLowerCase() === normalizedUsername
-  );
+  const account = getAccountByUsername(normalizedUsername);
   if (account) {
     const { password, ...safeAccount } = account;
     return { ...safeAccount, isGuest: account.isGuest, socketId: null };
@@ -1074,16 +1201,28 @@ const findUserByUsernameForAdmin = (username) => {
   return null;
 };
 
+// Compiled-pattern cache for extractUsernameFromCommand: the command
+// vocabulary is a small fixed set ('kick', 'ban', 'mute', ...), so compile
+// each command's four regexes once instead of on every admin command.
+const usernamePatternCache = new Map();
+
+const getUsernamePatterns = (commandWord) => {
+  let patterns = usernamePatternCache.get(commandWord);
+  if (!patterns) {
+    patterns = [
+      new RegExp(`${commandWord}\\s+(?:user\\s+)?["']?([\\w_]+)["']?`, 'i'),
+      new RegExp(`${commandWord}\\s+@?([\\w_]+)`, 'i'),
+      new RegExp(`@([\\w_]+).*${commandWord}`, 'i'),
+      new RegExp(`([\\w_]+).*${commandWord}`, 'i')
+    ];
+    usernamePatternCache.set(commandWord, patterns);
+  }
+  return patterns;
+};
+
 // Extract username from command text
 const extractUsernameFromCommand = (text, commandWord) => {
-  const patterns = [
-    new RegExp(`${commandWord}\\s+(?:user\\s+)?["']?([\\w_]+)["']?`, 'i'),
-    new RegExp(`${commandWord}\\s+@?([\\w_]+)`, 'i'),
-    new RegExp(`@([\\w_]+).*${commandWord}`, 'i'),
-    new RegExp(`([\\w_]+).*${commandWord}`, 'i')
-  ];
-  
-  for (const pattern of patterns) {
+  for (const pattern of getUsernamePatterns(commandWord)) {
     const match = text.match(pattern);
     if (match && match[1]) {
       const name = match[1].toLowerCase();
@@ -1136,9 +1275,15 @@ const handleAdminCommand = (inputText, dmRoomName, admin, adminSocket) => {
     // Execute kick
     const targetSocketId = targetUser.socketId || getSocketIdByUserId(targetUser.id);
     if (targetSocketId && onlineUsers[targetSocketId]) {
+      // contextRoom is only the admin's last-viewed room; kicking someone out
+      // of a room they're not in would desync the membership index
+      if (onlineUsers[targetSocketId].mainRoom !== contextRoom) {
+        return `⚠️ ${targetUser.username} is not currently in **${contextRoom}**.`;
+      }
       const targetSocket = io.sockets.sockets.get(targetSocketId);
       if (targetSocket) {
         targetSocket.leave(contextRoom);
+        removeRoomMember(contextRoom, targetSocketId);
         onlineUsers[targetSocketId].mainRoom = null;
         onlineUsers[targetSocketId].activeRoom = null;
         createSystemMessage(contextRoom, `${targetUser.username} was kicked from the room by AI_Bot (on ${admin.username}'s order).`);
@@ -1357,45 +1502,50 @@ const handleAdminCommand = (inputText, dmRoomName, admin, adminSocket) => {
 // Main AI response function
 const getAIResponse = async (inputText, roomName = 'general', roomUsers = [], requestingUser = null) => {
   return new Promise((resolve) => {
-    try {
-      // Check for admin commands in DMs
-      if (requestingUser && requestingUser.role === 'admin') {
-        const adminCommand = handleAdminCommand(inputText, roomName, requestingUser);
-        if (adminCommand) {
-          // Return admin command response immediately
-          resolve(adminCommand);
-          return;
+    // Defer the whole pipeline to the next loop turn: intent/sentiment
+    // analysis and response generation are pure synchronous CPU, and running
+    // them inline would hold up the chat-message broadcast that triggered us.
+    setImmediate(() => {
+      try {
+        // Check for admin commands in DMs
+        if (requestingUser && requestingUser.role === 'admin') {
+          const adminCommand = handleAdminCommand(inputText, roomName, requestingUser);
+          if (adminCommand) {
+            // Return admin command response immediately
+            resolve(adminCommand);
+            return;
+          }
         }
+
+        // Recognize intent
+        const intent = recognizeIntent(inputText);
+
+        // Analyze sentiment
+        const sentiment = analyzeSentiment(inputText);
+
+        // Extract entities
+        const entities = extractEntities(inputText, roomUsers);
+
+        // Generate contextual response
+        const response = generateResponse(inputText, intent, sentiment, entities, roomName);
+
+        // Simulate processing time (make it feel natural)
+        // Calculate delay with response length capped at 200 chars for performance
+        const cappedLength = Math.min(response.length, 200);
+        const delay = Math.min(
+          AI_CONFIG.MIN_RESPONSE_DELAY + cappedLength * AI_CONFIG.DELAY_PER_CHAR,
+          AI_CONFIG.MAX_RESPONSE_DELAY
+        );
+
+        setTimeout(() => {
+          resolve(response);
+        }, delay);
+
+      } catch (error) {
+        console.error('AI Error:', error);
+        resolve("I apologize, but I encountered an issue processing that. Please try again!");
       }
-      
-      // Recognize intent
-      const intent = recognizeIntent(inputText);
-      
-      // Analyze sentiment
-      const sentiment = analyzeSentiment(inputText);
-      
-      // Extract entities
-      const entities = extractEntities(inputText, roomUsers);
-      
-      // Generate contextual response
-      const response = generateResponse(inputText, intent, sentiment, entities, roomName);
-      
-      // Simulate processing time (make it feel natural)
-      // Calculate delay with response length capped at 200 chars for performance
-      const cappedLength = Math.min(response.length, 200);
-      const delay = Math.min(
-        AI_CONFIG.MIN_RESPONSE_DELAY + cappedLength * AI_CONFIG.DELAY_PER_CHAR,
-        AI_CONFIG.MAX_RESPONSE_DELAY
-      );
-      
-      setTimeout(() => {
-        resolve(response);
-      }, delay);
-      
-    } catch (error) {
-      console.error('AI Error:', error);
-      resolve("I apologize, but I encountered an issue processing that. Please try again!");
-    }
+    });
   });
 };
 // --- End Enhanced AI System ---
@@ -1548,16 +1698,12 @@ const generateModSuggestion = (behavior, username) => {
 // --- End AI Moderation Features ---
 
 const findUserByUsername = (username) => {
-  const normalizedUsername = username.toLowerCase();
-  const onlineSocketId = Object.keys(onlineUsers).find(socketId => 
-    onlineUsers[socketId].username.toLowerCase() === normalizedUsername
-  );
-  if (onlineSocketId) {
+  const normalizedUsername = normalizeUsername(username);
+  const onlineSocketId = usernameToSocketId.get(normalizedUsername);
+  if (onlineSocketId && onlineUsers[onlineSocketId]) {
     return { ...onlineUsers[onlineSocketId], socketId: onlineSocketId };
   }
-  const account = Object.values(userAccounts).find(u => 
-    u.username.toLowerCase() === normalizedUsername
-  );
+  const account = getAccountByUsername(normalizedUsername);
   if (account) {
     const { password, ...safeAccount } = account;
     return { ...safeAccount, isGuest: account.isGuest, socketId: null };
@@ -1565,19 +1711,18 @@ const findUserByUsername = (username) => {
   return null;
 };
 const getSocketIdByUserId = (userId) => {
-  return Object.keys(onlineUsers).find(socketId => onlineUsers[socketId]?.id === userId);
+  return userIdToSocketId.get(userId);
 };
 
+// Reserved Socket.IO room that every online admin joins, so admin events are
+// encoded once and fanned out by the adapter instead of being re-emitted
+// per admin socket. The '__' prefix is blocked in "create room" so a user
+// can't create (and then join) a room with this name.
+const ADMINS_ROOM = '__admins__';
+
 // NEW: Helper function to broadcast an event to all online admins.
 const broadcastToAdmins = (event, data) => {
-  Object.values(onlineUsers).forEach(onlineUser => {
-    if (onlineUser.role === 'admin') {
-      const adminSocketId = getSocketIdByUserId(onlineUser.id);
-      if (adminSocketId) {
-        io.to(adminSocketId).emit(event, data);
-      }
-    }
-  });
+  io.to(ADMINS_ROOM).emit(event, data);
 };
 
 // MODIFIED: Helper function to get all users, merging online state
@@ -1602,15 +1747,19 @@ const getUsersInRoom = (roomName) => {
   const roomMeta = rooms[roomName];
   if (!roomMeta || roomMeta.type === 'dm') return [];
   const users = [];
-  for (const socketId in onlineUsers) {
-    const user = onlineUsers[socketId];
-    // Check mainRoom, so users in a DM modal still appear in the main room list
-    if (user.mainRoom === roomName) { 
+  // The membership index tracks mainRoom, so users in a DM modal still appear
+  // in the main room list
+  const members = roomMembers[roomName];
+  if (members) {
+    const hostSet = getHostSet(roomName);
+    for (const socketId of members) {
+      const user = onlineUsers[socketId];
+      if (!user) continue;
       let role = 'user';
       if (user.role === 'admin') role = 'admin';
       else if (roomMeta.owner === user.id) role = 'owner';
-      else if (roomMeta.hosts.includes(user.id)) role = 'host';
-      users.push({ 
+      else if (hostSet.has(user.id)) role = 'host';
+      users.push({
         id: user.id, name: user.username, typing: user.typing, role,
         isSummoned: user.isSummoned, isSpectating: user.isSpectating,
         status: user.status || 'online',
@@ -1626,16 +1775,17 @@ const getUsersInRoom = (roomName) => {
   return users;
 };
 
+// Display role for a single user in a room; lets role changes broadcast a
+// minimal { userId, role } diff instead of re-sending the whole roster.
+const getRoomRole = (roomName, userId, globalRole = 'user') => {
+  if (globalRole === 'admin') return 'admin';
+  if (rooms[roomName]?.owner === userId) return 'owner';
+  return getHostSet(roomName).has(userId) ? 'host' : 'user';
+};
+
 const getPublicRoomsWithCounts = () => {
-  const userCounts = {};
-  for (const socketId in onlineUsers) {
-    const roomName = onlineUsers[socketId].mainRoom; // Use mainRoom
-    if (roomName && rooms[roomName] && rooms[roomName].type === 'public') {
-      userCounts[roomName] = (userCounts[roomName] || 0) + 1;
-    }
-  }
   return Object.values(rooms).filter(r => r.type === 'public').map(room => ({
-    ...room, userCount: (userCounts[room.name] || 0) + 1, // +1 for bot
+    ...room, userCount: (roomMembers[room.name]?.size || 0) + 1, // +1 for bot
   }));
 };
 
@@ -1656,7 +1806,10 @@ const getDMRoomsForUser = (user) => {
 };
 const getDmRoomName = (id1, id2) => [id1, id2].sort().join('__DM__');
 
-const leaveMainRoom = (socket) => {
+// skipRoomListEmit: callers that immediately re-broadcast the room list
+// themselves (room switches, summon/release) pass true so one logical move
+// doesn't push two full room-list updates to every client.
+const leaveMainRoom = (socket, skipRoomListEmit = false) => {
   const user = onlineUsers[socket.id];
   if (!user || !user.mainRoom) return; // Use mainRoom
   
@@ -1664,6 +1817,7 @@ const leaveMainRoom = (socket) => {
   const roomMeta = rooms[oldRoomName];
   
   socket.leave(oldRoomName);
+  removeRoomMember(oldRoomName, socket.id);
   user.location = 'lobby';
   user.mainRoom = null; // Clear mainRoom
   user.activeRoom = null; // Also clear activeRoom
@@ -1673,7 +1827,9 @@ const leaveMainRoom = (socket) => {
   if (roomMeta && roomMeta.type !== 'dm') {
     createSystemMessage(oldRoomName, `${user.username} has left.`);
     io.to(oldRoomName).emit("user list", getUsersInRoom(oldRoomName));
-    io.emit("room list", getPublicRoomsWithCounts());
+    if (!skipRoomListEmit) {
+      io.emit("room list", getPublicRoomsWithCounts());
+    }
   }
 };
 // --- End Helper Functions ---
@@ -1687,7 +1843,7 @@ app.post("/submit-ticket", (req, res) => {
       return res.status(400).send("Missing username or message.");
     }
 
-    const account = Object.values(userAccounts).find(u => u.username.toLowerCase() === username.toLowerCase());
+    const account = getAccountByUsername(username);
     if (!account) {
       return res.status(404).send("User not found.");
     }
@@ -1715,7 +1871,7 @@ app.post("/submit-ticket", (req, res) => {
     supportTickets.push(newTicket);
 
     // Notify all online admins
-    broadcastToAdmins('admin:ticketsUpdated', supportTickets.sort((a, b) => new Date(b.timestamp).getTime() - new Date(a.timestamp).getTime()));
+    broadcastToAdmins('admin:ticketsUpdated', supportTickets.sort(byTimestampDesc));
 
     res.status(200).send("Ticket submitted successfully.");
 
@@ -1821,24 +1977,21 @@ io.use((socket, next) => {
   let userAccount = null;
 
   try {
-    if (auth.type === 'login' || auth.type === 'register') {
-      const existingAccount = Object.values(userAccounts).find(u => u.username.toLowerCase() === auth.username.toLowerCase());
-      // MODIFIED: Handle banned login attempt
-      if (existingAccount && bannedUserIds.has(existingAccount.id)) { 
-        throw new Error("banned"); 
-      }
-    }
-
     if (auth.type === 'login') {
-      const account = Object.values(userAccounts).find(u => u.username.toLowerCase() === auth.username.toLowerCase());
+      const account = getAccountByUsername(auth.username);
+      // MODIFIED: Handle banned login attempt
+      if (account && bannedUserIds.has(account.id)) { throw new Error("banned"); }
       if (!account || account.password !== auth.password) { throw new Error("Invalid username or password."); }
       userAccount = account;
     } else if (auth.type === 'register') {
-      if (Object.values(userAccounts).some(u => u.username.toLowerCase() === auth.username.toLowerCase())) { 
-        throw new Error("Username is already taken."); 
+      const existingAccount = getAccountByUsername(auth.username);
+      // MODIFIED: Handle banned attempt to re-register a banned name
+      if (existingAccount && bannedUserIds.has(existingAccount.id)) { throw new Error("banned"); }
+      if (existingAccount) {
+        throw new Error("Username is already taken.");
       }
       // NEW: Check for existing email
-      if (Object.values(userAccounts).some(u => u.email.toLowerCase() === auth.email.toLowerCase())) {
+      if (emailToAccountId.has(auth.email.toLowerCase())) {
         throw new Error("Email is already taken.");
       }
       const newId = `user-${Date.now()}`;
@@ -1849,10 +2002,12 @@ io.use((socket, next) => {
         isGloballyMuted: false, 
       };
       userAccounts[newId] = userAccount;
+      usernameToAccountId.set(normalizeUsername(auth.username), newId);
+      emailToAccountId.set(auth.email.toLowerCase(), newId);
     } else if (auth.type === 'guest') {
       if (!auth.username) { throw new Error("Guest username is required."); }
-      if (Object.values(userAccounts).some(u => u.username.toLowerCase() === auth.username.toLowerCase())) { throw new Error("This username is registered. Please log in."); }
-      if (Object.values(onlineUsers).some(u => u.username.toLowerCase() === auth.username.toLowerCase())) { throw new Error("This guest name is already in use."); }
+      if (getAccountByUsername(auth.username)) { throw new Error("This username is registered. Please log in."); }
+      if (usernameToSocketId.has(normalizeUsername(auth.username))) { throw new Error("This guest name is already in use."); }
       const newId = `guest-${Date.now()}`;
       userAccount = { 
         id: newId, username: auth.username, isGuest: true, fullName: auth.username, 
@@ -1861,6 +2016,13 @@ io.use((socket, next) => {
         isGloballyMuted: false, 
       };
       // Do not save guest accounts to userAccounts
+    } else if (auth.type === 'token') {
+      // Reconnect with a previously issued signed token: no credential
+      // round-trip, just signature verification and a direct id lookup
+      const userId = verifySessionToken(auth.token);
+      if (!userId || !userAccounts[userId]) { throw new Error("Invalid or expired session."); }
+      if (bannedUserIds.has(userId)) { throw new Error("banned"); }
+      userAccount = userAccounts[userId];
     } else {
       throw new Error("Invalid authentication request.");
     }
@@ -1895,10 +2057,21 @@ io.on("connection", (socket) => {
     hiddenDMs: userAccount.hiddenDMs || [],
     isGloballyMuted: userAccount.isGloballyMuted || false, // Copy from account
   };
+  userIdToSocketId.set(userAccount.id, socket.id);
+  usernameToSocketId.set(normalizeUsername(userAccount.username), socket.id);
+
+  if (onlineUsers[socket.id].role === 'admin') {
+    socket.join(ADMINS_ROOM);
+  }
 
   const { password, ...safeAccount } = userAccount;
-  // MODIFIED: Send 'lobby' status on initial connection
-  socket.emit("self details", { ...safeAccount, ...onlineUsers[socket.id], status: 'lobby' });
+  // MODIFIED: Send 'lobby' status on initial connection. Registered accounts
+  // also get a signed token they can reconnect with (auth.type 'token')
+  // without another credential round-trip.
+  socket.emit("self details", {
+    ...safeAccount, ...onlineUsers[socket.id], status: 'lobby',
+    ...(userAccount.isGuest ? {} : { authToken: signSessionToken(userAccount.id) }),
+  });
 
   // Notify admins that user list is updated
   broadcastToAdmins('admin:userListUpdated', getAllUsersSafe());
@@ -1914,7 +2087,8 @@ io.on("connection", (socket) => {
 
   socket.on("create room", (roomName, callback) => {
     const user = onlineUsers[socket.id];
-    if (user && !user.isGuest && roomName && !rooms[roomName]) {
+    // Names starting with '__' are reserved for internal rooms (e.g. ADMINS_ROOM)
+    if (user && !user.isGuest && roomName && !roomName.startsWith('__') && !rooms[roomName]) {
       rooms[roomName] = { 
         name: roomName, owner: user.id, hosts: [], type: 'public',
         isLocked: false, topic: `Welcome to #${roomName}`
@@ -1958,9 +2132,11 @@ io.on("connection", (socket) => {
     if (!user || !room || user.isSummoned) return;
 
     if (room.type === 'public' || room.type === 'judgement') {
-      // If joining a main room, leave the previous main room
-      leaveMainRoom(socket); 
+      // If joining a main room, leave the previous main room; the room list
+      // is broadcast once below with both counts already updated
+      leaveMainRoom(socket, true);
       user.mainRoom = roomName;
+      addRoomMember(roomName, socket.id);
       user.location = 'chat';
       user.status = roomName; // MODIFIED: Set status to room name
     } else if (room.type === 'dm') {
@@ -2012,6 +2188,7 @@ io.on("connection", (socket) => {
 
     if (activeRoom.type === 'public' || activeRoom.type === 'judgement') {
       // User is leaving their main room (e.g., clicking "Lobby")
+      removeRoomMember(activeRoomName, socket.id);
       user.mainRoom = null;
       user.activeRoom = null;
       user.location = 'lobby';
@@ -2035,7 +2212,11 @@ io.on("connection", (socket) => {
   socket.on("chat message", ({ text }) => {
     const user = onlineUsers[socket.id];
     const roomName = user?.activeRoom; // Use activeRoom
-    if (!user || !roomName || !text) return;
+    if (!user || !roomName || !text || typeof text !== 'string') return;
+    if (text.length > MAX_MESSAGE_LENGTH) {
+      return sendSystemMessageToSocket(socket.id, roomName,
+        `⚠️ Message not sent: it exceeds the ${MAX_MESSAGE_LENGTH} character limit.`);
+    }
 
     const roomMeta = rooms[roomName];
     if (user.isSpectating) return;
@@ -2113,12 +2294,11 @@ io.on("connection", (socket) => {
     const message = {
       id: `${Date.now()}-${Math.random().toString(36).substr(2, 9)}`,
       user: user.username, text,
-      time: new Date().toLocaleTimeString([], { hour: '2-digit', minute: '2-digit' }),
+      time: formatMessageTime(),
       type: 'user', room: roomName,
     };
 
-    if (!messagesByRoom[roomName]) messagesByRoom[roomName] = [];
-    messagesByRoom[roomName].push(message);
+    pushRoomMessage(roomName, message);
     io.to(roomName).emit("chat message", message);
     
     if (user.isGuest) user.messageCount++;
@@ -2169,14 +2349,18 @@ io.on("connection", (socket) => {
       }
     }
     
-    // Autonomous thought sharing (only in non-DM public rooms)
+    // Autonomous thought sharing (only in non-DM public rooms).
+    // Deferred: shareThought runs the conversation-analysis pass, which is
+    // CPU work that shouldn't delay the message broadcast above.
     if (roomMeta.type !== 'dm' && Math.random() < AI_CONFIG.THOUGHT_PROBABILITY) {
-      const thought = shareThought(roomName);
-      if (thought) {
-        setTimeout(() => {
-          createBotMessage(roomName, thought, 'thought');
-        }, 2000); // Share thought 2 seconds after message
-      }
+      setImmediate(() => {
+        const thought = shareThought(roomName);
+        if (thought) {
+          setTimeout(() => {
+            createBotMessage(roomName, thought, 'thought');
+          }, 2000); // Share thought 2 seconds after message
+        }
+      });
     }
 
     if (roomMeta.type === 'dm') {
@@ -2187,10 +2371,14 @@ io.on("connection", (socket) => {
         if (targetSocketId) {
           const targetUser = onlineUsers[targetSocketId];
           if (targetUser && targetUser.settings.enableWhispers) {
-            targetUser.hiddenDMs = targetUser.hiddenDMs.filter(dm => dm !== roomName);
-             if (!targetUser.isGuest && userAccounts[targetUser.id]) {
+            // Only rebuild the hidden list when this DM is actually hidden;
+            // on the common path (every DM message) nothing changes
+            if (targetUser.hiddenDMs.includes(roomName)) {
+              targetUser.hiddenDMs = targetUser.hiddenDMs.filter(dm => dm !== roomName);
+              if (!targetUser.isGuest && userAccounts[targetUser.id]) {
                 userAccounts[targetUser.id].hiddenDMs = targetUser.hiddenDMs;
-             }
+              }
+            }
             io.to(targetSocketId).emit("new whisper", roomMeta);
             if (targetUser.location === 'lobby') {
               io.to(targetSocketId).emit("dm list update", getDMRoomsForUser(targetUser));
@@ -2210,7 +2398,7 @@ io.on("connection", (socket) => {
     const msgIndex = messagesByRoom[room].findIndex((msg) => msg.id === id);
     if (msgIndex === -1) return; const message = messagesByRoom[room][msgIndex];
     if ((message.user === user.username || user.role === 'admin') && !message.deleted) {
-      const deletedTime = new Date().toLocaleTimeString([], { hour: '2-digit', minute: '2-digit' });
+      const deletedTime = formatMessageTime();
       messagesByRoom[room][msgIndex] = { ...message, text: `This message was removed by ${user.username}`, deleted: true, time: deletedTime, };
       io.to(room).emit("message updated", messagesByRoom[room][msgIndex]);
     }
@@ -2219,12 +2407,13 @@ io.on("connection", (socket) => {
   // OPTIMIZED: Uses user.activeRoom
   socket.on("edit message", ({ id, newText }) => {
     const user = onlineUsers[socket.id]; const room = user?.activeRoom; // Use activeRoom
-    if (!user || !room || !messagesByRoom[room] || !newText || !newText.trim()) return;
+    if (!user || !room || !messagesByRoom[room] || !newText || typeof newText !== 'string' || !newText.trim()) return;
+    if (newText.length > MAX_MESSAGE_LENGTH) return;
     const messages = messagesByRoom[room]; const msgIndex = messages.findIndex(m => m.id === id);
     if (msgIndex === -1) return; const message = messages[msgIndex];
     const isLastMessage = msgIndex === messages.length - 1;
     if (!message.deleted && ( (message.user === user.username && isLastMessage) || user.role === 'admin' )) {
-      const editedTime = new Date().toLocaleTimeString([], { hour: '2-digit', minute: '2-digit' });
+      const editedTime = formatMessageTime();
       messages[msgIndex] = { ...message, text: newText, time: editedTime, edited: true, };
       io.to(room).emit("message updated", messages[msgIndex]);
     }
@@ -2249,7 +2438,11 @@ io.on("connection", (socket) => {
     if (user.role === 'admin' || room.owner === user.id) {
       if (!room.hosts.includes(targetUserId)) {
         room.hosts.push(targetUserId);
-        io.to(roomName).emit("user list", getUsersInRoom(roomName));
+        invalidateHostSet(roomName);
+        io.to(roomName).emit("user role update", {
+          userId: targetUserId,
+          role: getRoomRole(roomName, targetUserId, targetAccount.role),
+        });
         createSystemMessage(roomName, `${user.username} promoted ${targetAccount.username} to Host.`);
       }
     }
@@ -2262,8 +2455,14 @@ io.on("connection", (socket) => {
     const targetAccount = userAccounts[targetUserId];
     if (!user || user.isGuest || !room || !targetAccount) return;
     if (user.role === 'admin' || room.owner === user.id) {
-      room.hosts = room.hosts.filter(id => id !== targetUserId);
-      io.to(roomName).emit("user list", getUsersInRoom(roomName));
+      if (room.hosts.includes(targetUserId)) {
+        room.hosts = room.hosts.filter(id => id !== targetUserId);
+        invalidateHostSet(roomName);
+      }
+      io.to(roomName).emit("user role update", {
+        userId: targetUserId,
+        role: getRoomRole(roomName, targetUserId, targetAccount.role),
+      });
       createSystemMessage(roomName, `${user.username} demoted ${targetAccount.username}.`);
     }
   });
@@ -2302,9 +2501,11 @@ io.on("connection", (socket) => {
     }
     
     const dmRoom = rooms[dmRoomName];
-    dmRoom.lastActivity = Date.now(); 
+    dmRoom.lastActivity = Date.now();
 
-    user.hiddenDMs = user.hiddenDMs.filter(dm => dm !== dmRoomName);
+    if (user.hiddenDMs.includes(dmRoomName)) {
+      user.hiddenDMs = user.hiddenDMs.filter(dm => dm !== dmRoomName);
+    }
     if (isNew) {
       if (isAIBot) {
         createSystemMessage(dmRoomName, "🤖 AI_Bot: Hello! I'm ready to help. Ask me anything!");
@@ -2320,7 +2521,9 @@ io.on("connection", (socket) => {
     // Only notify target if it's a real user (not AI_Bot)
     if (targetSocketId && !isAIBot) {
       const target = onlineUsers[targetSocketId];
-      target.hiddenDMs = target.hiddenDMs.filter(dm => dm !== dmRoomName);
+      if (target.hiddenDMs.includes(dmRoomName)) {
+        target.hiddenDMs = target.hiddenDMs.filter(dm => dm !== dmRoomName);
+      }
       io.to(targetSocketId).emit("new whisper", dmRoom);
       if (target.location === 'lobby') {
         io.to(targetSocketId).emit("dm list update", getDMRoomsForUser(target));
@@ -2379,14 +2582,14 @@ io.on("connection", (socket) => {
   socket.on("admin:getReports", (callback) => {
     const user = onlineUsers[socket.id];
     if (!user || user.role !== 'admin' || typeof callback !== 'function') return;
-    callback(reports.sort((a, b) => new Date(b.timestamp).getTime() - new Date(a.timestamp).getTime()));
+    callback(reports.sort(byTimestampDesc));
   });
 
   // NEW: Get Tickets
   socket.on("admin:getTickets", (callback) => {
     const user = onlineUsers[socket.id];
     if (!user || user.role !== 'admin' || typeof callback !== 'function') return;
-    callback(supportTickets.sort((a, b) => new Date(b.timestamp).getTime() - new Date(a.timestamp).getTime()));
+    callback(supportTickets.sort(byTimestampDesc));
   });
 
   // NEW: Resolve Item (Report or Ticket)
@@ -2397,11 +2600,11 @@ io.on("connection", (socket) => {
     if (type === 'report') {
       const report = reports.find(r => r.reportId === id);
       if (report) report.status = 'closed';
-      broadcastToAdmins('admin:reportsUpdated', reports.sort((a, b) => new Date(b.timestamp).getTime() - new Date(a.timestamp).getTime()));
+      broadcastToAdmins('admin:reportsUpdated', reports.sort(byTimestampDesc));
     } else if (type === 'ticket') {
       const ticket = supportTickets.find(t => t.ticketId === id);
       if (ticket) ticket.status = 'closed';
-      broadcastToAdmins('admin:ticketsUpdated', supportTickets.sort((a, b) => new Date(b.timestamp).getTime() - new Date(a.timestamp).getTime()));
+      broadcastToAdmins('admin:ticketsUpdated', supportTickets.sort(byTimestampDesc));
     }
   });
 
@@ -2428,6 +2631,12 @@ io.on("connection", (socket) => {
     const targetSocketId = getSocketIdByUserId(targetUserId);
     if (targetSocketId && onlineUsers[targetSocketId]) {
       onlineUsers[targetSocketId].role = role;
+      // Keep the admins room membership in sync with the new role
+      const targetSocket = io.sockets.sockets.get(targetSocketId);
+      if (targetSocket) {
+        if (role === 'admin') targetSocket.join(ADMINS_ROOM);
+        else targetSocket.leave(ADMINS_ROOM);
+      }
       // Send updated details to the target user
       const { password, ...safeAccount } = userAccounts[targetUserId];
       io.to(targetSocketId).emit("self details", { ...safeAccount, ...onlineUsers[targetSocketId] });
@@ -2501,7 +2710,11 @@ io.on("connection", (socket) => {
 
     // Update allowed fields
     if (typeof details.fullName === 'string') account.fullName = details.fullName;
-    if (typeof details.email === 'string') account.email = details.email;
+    if (typeof details.email === 'string') {
+      emailToAccountId.delete(account.email.toLowerCase());
+      account.email = details.email;
+      emailToAccountId.set(account.email.toLowerCase(), account.id);
+    }
     if (typeof details.about === 'string') account.about = details.about;
 
     // Send update to all admins
@@ -2560,6 +2773,7 @@ io.on("connection", (socket) => {
     // Use the existing join room logic, but force the switch
     leaveMainRoom(socket); // Leave admin's current room
     admin.mainRoom = roomName;
+    addRoomMember(roomName, socket.id);
     admin.activeRoom = roomName;
     admin.location = 'chat'; 
     admin.status = roomName; // Set status
@@ -2604,7 +2818,7 @@ io.on("connection", (socket) => {
     reports.push(newReport);
 
     // NEW: Notify admins of the updated report list
-    broadcastToAdmins('admin:reportsUpdated', reports.sort((a, b) => new Date(b.timestamp).getTime() - new Date(a.timestamp).getTime()));
+    broadcastToAdmins('admin:reportsUpdated', reports.sort(byTimestampDesc));
     
     // Still send the real-time alert
     Object.values(onlineUsers).forEach(onlineUser => {
@@ -2632,8 +2846,9 @@ io.on("connection", (socket) => {
     const judgementRoom = rooms[judgementRoomName];
     
     // Force admin to join
-    leaveMainRoom(socket); // Leave admin's current room
+    leaveMainRoom(socket, true); // Leave admin's current room
     admin.mainRoom = judgementRoomName;
+    addRoomMember(judgementRoomName, socket.id);
     admin.activeRoom = judgementRoomName;
     admin.location = 'chat'; 
     admin.status = judgementRoomName; // MODIFIED
@@ -2643,8 +2858,9 @@ io.on("connection", (socket) => {
     // Force target to join
     const targetSocket = io.sockets.sockets.get(targetSocketId);
     if (targetSocket) {
-      leaveMainRoom(targetSocket); // Leave target's current room
+      leaveMainRoom(targetSocket, true); // Leave target's current room
       target.mainRoom = judgementRoomName;
+      addRoomMember(judgementRoomName, targetSocketId);
       target.activeRoom = judgementRoomName;
       target.location = 'chat'; 
       target.status = judgementRoomName; // MODIFIED
@@ -2674,17 +2890,18 @@ io.on("connection", (socket) => {
     
     const targetSocket = io.sockets.sockets.get(targetSocketId);
     if (targetSocket) {
-      leaveMainRoom(targetSocket);
+      leaveMainRoom(targetSocket, true);
       target.isSummoned = false;
-      targetSocket.emit("force disconnect"); 
+      targetSocket.emit("force disconnect");
     }
-    
-    leaveMainRoom(socket);
+
+    leaveMainRoom(socket, true);
     socket.emit("force disconnect");
     
     if (judgementRoomName && rooms[judgementRoomName]?.type === 'judgement') {
       createSystemMessage(judgementRoomName, `${admin.username} has released ${target.username}.`);
       delete rooms[judgementRoomName]; delete messagesByRoom[judgementRoomName];
+      invalidateHostSet(judgementRoomName);
     }
     io.emit("room list", getPublicRoomsWithCounts());
   });
@@ -2859,7 +3076,11 @@ io.on("connection", (socket) => {
           }
           if (!roomMeta.hosts.includes(targetUser.id)) {
             roomMeta.hosts.push(targetUser.id);
-            io.to(room).emit("user list", getUsersInRoom(room));
+            invalidateHostSet(room);
+            io.to(room).emit("user role update", {
+              userId: targetUser.id,
+              role: getRoomRole(room, targetUser.id, targetUser.role),
+            });
             createBotMessage(room, `Done. I have promoted ${targetUser.username} to Host.`);
           } else {
             return sendSystemMessageToSocket(socket.id, room, `${targetUser.username} is already a Host.`);
@@ -2877,7 +3098,11 @@ io.on("connection", (socket) => {
           }
           if (roomMeta.hosts.includes(targetUser.id)) {
             roomMeta.hosts = roomMeta.hosts.filter(id => id !== targetUser.id);
-            io.to(room).emit("user list", getUsersInRoom(room));
+            invalidateHostSet(room);
+            io.to(room).emit("user role update", {
+              userId: targetUser.id,
+              role: getRoomRole(room, targetUser.id, targetUser.role),
+            });
             createBotMessage(room, `Understood. I have demoted ${targetUser.username} from their host position.`);
           } else {
             return sendSystemMessageToSocket(socket.id, room, `${targetUser.username} is not a Host in this room.`);
@@ -2930,6 +3155,7 @@ io.on("connection", (socket) => {
       case 'demote':
         if (args === 'all') {
           roomMeta.hosts = [];
+          invalidateHostSet(room);
           createSystemMessage(room, `${admin.username} has demoted all hosts.`);
           io.to(room).emit("user list", getUsersInRoom(room));
         }
@@ -2963,6 +3189,12 @@ io.on("connection", (socket) => {
       }
       leaveMainRoom(socket); // Use leaveMainRoom
       delete onlineUsers[socket.id];
+      if (userIdToSocketId.get(user.id) === socket.id) {
+        userIdToSocketId.delete(user.id);
+      }
+      if (usernameToSocketId.get(normalizeUsername(user.username)) === socket.id) {
+        usernameToSocketId.delete(normalizeUsername(user.username));
+      }
       // Notify admins of status change
       broadcastToAdmins('admin:userListUpdated', getAllUsersSafe());
     } else {
@@ -2976,7 +3208,19 @@ io.on("connection", (socket) => {
 const clientDistPath = path.resolve(__dirname, "../client/dist");
 
 // Serve static assets (JS, CSS, images, etc.)
-app.use(express.static(clientDistPath));
+// Vite emits content-hashed filenames under /assets, so those can be cached
+// forever; index.html must always revalidate or clients keep stale bundles
+// across deploys.
+app.use(express.static(clientDistPath, {
+  maxAge: "1d",
+  setHeaders: (res, filePath) => {
+    if (filePath.includes(`${path.sep}assets${path.sep}`)) {
+      res.setHeader("Cache-Control", "public, max-age=31536000, immutable");
+    } else if (filePath.endsWith(".html")) {
+      res.setHeader("Cache-Control", "no-cache");
+    }
+  },
+}));
 
 // Let React handle all non-API, non-socket routes
 app.get("*", (req, res) => {
@@ -2993,6 +3237,13 @@ app.get("*", (req, res) => {
   });
 });
 
+// Keep-alive must outlive the idle timeout of typical reverse proxies (60s),
+// otherwise the proxy reuses a connection the server just closed and clients
+// see resets followed by Socket.IO reconnect storms. headersTimeout has to
+// stay above keepAliveTimeout for the same reason.
+server.keepAliveTimeout = 65000;
+server.headersTimeout = 66000;
+
 // Start HTTP + Socket.io server
 server.listen(PORT, () => {
   console.log(`✅ Yayy Wibali Chat Network running on port ${PORT}`);